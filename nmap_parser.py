@@ -1,90 +1,176 @@
-import xml.etree.ElementTree as ET
-import pandas as pd
+from lxml import etree as ET
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import argparse
+import csv
+import importlib.machinery
+import importlib.util
+import os
 import sys
+import tempfile
 
-def nmap_parser():
-	list=[]
-	try:
-		#  Taking input
-		xml_file = sys.argv[1]
-		
-		#  Checking for xml extension
-		if xml_file.split(".")[-1] != "xml":
-			print("Please provide an xml file only")
-			exit()
+COLUMNS = ['IP','Port Number','Protocol','State','Service','Details']
 
-		tree = ET.parse(xml_file)
-		root = tree.getroot()
-	
-	#  Handling absence of files in command lines
-	except IndexError as e:
-		print("Usage: python nmap_parser.py <xml file name>")
-		exit()
+#  Low-cardinality columns stored as categories in Parquet/Feather output
+COLUMN_DTYPES = {'Protocol': 'category', 'State': 'category', 'Service': 'category'}
 
-	#  Handling improper structured xml file
-	except ET.ParseError as e:
-		print("Could not parse the given XML file, please check the format")
-		exit()
+#  Compiled once and reused for every host
+PORTS_XPATH = ET.XPath('ports/port')
 
-	for host in root.findall('host'):
-		ip_address = host.find('address').get('addr')
-		
-		if host.find('hostnames') is not None:
-			if host.find('hostnames').find('hostname') is not None:
-				hostname = host.find('hostnames').find('hostname').get('name')
+#  Streaming <host> elements so only one host subtree is held in memory
+def iter_hosts(xml_file):
+	context = ET.iterparse(xml_file, events=('end',), tag='host')
+	try:
+		for _, host in context:
+			yield host
 
-		for port in host.find('ports').findall('port'):
+			#  Freeing the processed host and the hosts before it
+			host.clear()
+			while host.getprevious() is not None:
+				del host.getparent()[0]
 
-			#Getting Protocol
-			protocol = port.get('protocol')
-			if protocol is None:
-				protocol = "Unknown"
+	#  Handling improper structured xml file
+	except ET.XMLSyntaxError as e:
+		print("Could not parse " + xml_file + ", please check the format")
+		sys.exit(1)
 
-			# Getting Port Number
-			portnumber = port.get('portid')
-			if portnumber is None:
-				portnumber = "Unknown"
+#  Extracting one report row per port
+def iter_rows(xml_file, open_only=False):
+	for host in iter_hosts(xml_file):
+		ip_address = host.find('address').get('addr')
 
+		for port in PORTS_XPATH(host):
 			# CHecking Port State
-			if port.find('state') is not None:
-				if port.find('state').get('state') is not None:
-					state = port.find('state').get('state')
-				elif port.find('state').get('state') is None:
-					state = "Unknown"
-
-			if port.find('service') is not None:
-				if port.find('service').get('name') is not None:
-					service = port.find('service').get('name')
-
-			#Checking Product Info
-			if port.find('service') is not None:
-
-				if port.find('service').get('product') is not None:
-					product = port.find('service').get('product')
-					details = product.replace("", "")
-
-				elif port.find('service').get('product') is None:
-					details = "Unknown"
-
-				
-				if port.find('service').get('version') is not None:
-					version = port.find('service').get('version')
-					details = details + '(' + version + ')'
-
-				elif port.find('service').get('version') and port.find('service').get('product') is None:
-					details = "Unknown"
+			state_el = port.find('state')
+			if state_el is None:
+				state = "Unknown"
+			else:
+				state = state_el.get('state', "Unknown")
+
+			#  Skipping everything else about ports that will not be reported
+			if open_only and state != 'open':
+				continue
+
+			#  Getting Protocol and Port Number
+			protocol = port.get('protocol', "Unknown")
+			portnumber = port.get('portid', "Unknown")
+
+			svc_el = port.find('service')
+
+			#  Ports without a service element (mostly closed/filtered) take the short path
+			if svc_el is None:
+				service = details = "Unknown"
+			else:
+				svc_get = svc_el.get
+				service = svc_get('name', "Unknown")
+
+				#Checking Product Info
+				product = svc_get('product')
+				version = svc_get('version')
+				extrainfo = svc_get('extrainfo')
+
+				parts = []
+				if product:
+					parts.append(product)
+				if version:
+					parts.append('(' + version + ')')
+				if extrainfo:
+					parts.append(extrainfo)
+				details = ' '.join(parts) if parts else "Unknown"
+
+			yield (ip_address,portnumber,protocol,state,service,details)
+
+#  Parsing a whole report in a worker process
+def parse_file(xml_file, open_only=False):
+	return list(iter_rows(xml_file, open_only))
+
+#  Parsing several reports in parallel, one file per process
+def iter_pool_rows(xml_files, open_only=False):
+	with ProcessPoolExecutor(max_workers=min(len(xml_files), os.cpu_count() or 1)) as executor:
+		for rows in executor.map(parse_file, xml_files, repeat(open_only)):
+			yield from rows
+
+#  Streaming a single report directly, without an extra generator in between
+def iter_all_rows(xml_files, open_only=False):
+	if len(xml_files) == 1:
+		return iter_rows(xml_files[0], open_only)
+
+	return iter_pool_rows(xml_files, open_only)
+
+#  Writing columnar formats through pandas, only imported when asked for
+def write_columnar(rows, output_file, output_format):
+	try:
+		import pandas as pd
+		import pyarrow
+	except ImportError:
+		print("Writing " + output_format + " files requires pandas and pyarrow")
+		sys.exit(1)
+
+	#  Collecting each column in its own list so pandas needs no transpose
+	columns = ([], [], [], [], [], [])
+	add_ip, add_port, add_protocol, add_state, add_service, add_details = (column.append for column in columns)
+	for ip_address, portnumber, protocol, state, service, details in rows:
+		add_ip(ip_address)
+		add_port(portnumber)
+		add_protocol(protocol)
+		add_state(state)
+		add_service(service)
+		add_details(details)
+
+	#  Declaring the column types up front instead of letting pandas infer them
+	data = {name: pd.array(column, dtype=COLUMN_DTYPES.get(name, 'string')) for name, column in zip(COLUMNS, columns)}
+	data['Port Number'] = pd.to_numeric(data['Port Number'], errors='coerce').astype('Int32')
+	df = pd.DataFrame(data, copy=False)
+	if output_format == 'parquet':
+		df.to_parquet(output_file, compression='zstd', index=False)
+	else:
+		df.to_feather(output_file)
 
-				if port.find('service').get('extrainfo') is not None:
-					extrainfo = port.find('service').get('extrainfo')
-					details = details  + extrainfo  
+def nmap_parser():
+	parser = argparse.ArgumentParser(description="Convert nmap XML reports to CSV, Parquet or Feather")
+	parser.add_argument('xml_files', nargs='+', metavar='xml_file', help="nmap XML report(s), combined into one output")
+	parser.add_argument('--format', choices=['csv', 'parquet', 'feather'], default='csv',
+		help="output format, csv by default (parquet/feather need pandas and pyarrow)")
+	parser.add_argument('-o', '--output', help="output file name, nmap_parser_output.<format> by default")
+	parser.add_argument('--open-only', action='store_true', help="only report open ports")
+	args = parser.parse_args()
+
+	#  Checking every input before any parsing starts
+	for xml_file in args.xml_files:
+		if not xml_file.lower().endswith('.xml'):
+			print("Please provide an xml file only")
+			sys.exit(1)
 
-				elif port.find('service').get('version') and port.find('service').get('product') and port.find('service').get('extrainfo') is None:
-					details = "Unknown"
+		if not os.path.isfile(xml_file):
+			print("Could not find " + xml_file)
+			sys.exit(1)
 
-			list.append((ip_address,portnumber,protocol,state,service,details))
+	output_file = args.output or 'nmap_parser_output.' + args.format
 
-		df=pd.DataFrame(list,columns=['IP','Port Number','Protocol','State','Service','Details'])
-		df.to_csv('nmap_parser_output.csv')
+	#  Writing to a temporary file next to the output first, so a failed run leaves any existing report untouched
+	fd, tmp_file = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(output_file) or '.')
+	os.close(fd)
+	try:
+		if args.format == 'csv':
+			#  Streaming rows out as ports are parsed, through a 1 MiB write buffer
+			with open(tmp_file, 'w', newline='', encoding='utf-8', buffering=1 << 20) as f:
+				writer = csv.writer(f)
+				writer.writerow(COLUMNS)
+				writer.writerows(iter_all_rows(args.xml_files, args.open_only))
+		else:
+			write_columnar(iter_all_rows(args.xml_files, args.open_only), tmp_file, args.format)
+
+		#  mkstemp only gives the owner access, the report gets the usual permissions
+		umask = os.umask(0)
+		os.umask(umask)
+		os.chmod(tmp_file, 0o666 & ~umask)
+		os.replace(tmp_file, output_file)
+
+	#  Removing the partial output on parse errors, missing modules, Ctrl+C or a locked output file
+	except BaseException:
+		if os.path.exists(tmp_file):
+			os.remove(tmp_file)
+		raise
 
 	message = "Report created Successfully"
 	return message
@@ -92,5 +178,16 @@ def nmap_parser():
 
 if __name__=='__main__':
 
-	result = nmap_parser()
+	#  Using a mypyc-compiled build of this file only when one sits next to it and is newer than the source
+	run = nmap_parser
+
+	#  A file name that is not a valid module name (e.g. nmap2csv.v2.py) cannot have a compiled build
+	module_name = os.path.splitext(os.path.basename(__file__))[0]
+	spec = importlib.util.find_spec(module_name) if module_name.isidentifier() else None
+	compiled = spec.origin if spec is not None else None
+	if (compiled is not None and compiled.endswith(tuple(importlib.machinery.EXTENSION_SUFFIXES))
+			and os.path.getmtime(compiled) >= os.path.getmtime(__file__)):
+		run = importlib.import_module(module_name).nmap_parser
+
+	result = run()
 	print(result)
\ No newline at end of file